@@ -105,6 +105,14 @@ class Datalog:
         ''' run the datalog program '''
         return DatalogIntepretor().run(self.prog)
 
+    def run_async(self, executor=None):
+        '''
+        run the datalog program without blocking the event loop
+        async for event in prog.run_async(): ...
+        the last event (kind 'finish') carry the output
+        '''
+        return DatalogIntepretor().run_async(self.prog, executor)
+
 
 def program(name: str) -> Datalog:
     ''' create a Datalog '''
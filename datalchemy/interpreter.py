@@ -5,8 +5,11 @@ Yihao Sun
 2021 Syracuse
 '''
 
+import asyncio
 import sys
+import threading
 import time
+from dataclasses import dataclass
 
 import networkx as nx
 from sqlalchemy import create_engine, Table, MetaData, Column
@@ -36,11 +39,34 @@ def val_to_sql_str(v):
         return str(v)
 
 
+ITERATION_EVENT = 'iteration'
+STRATUM_EVENT = 'stratum'
+FINISH_EVENT = 'finish'
+
+
+@dataclass
+class EvalProgress:
+    '''
+    progress event emitted while evaluating a program
+    kind is one of ITERATION_EVENT, STRATUM_EVENT, FINISH_EVENT
+    elapsed is the seconds spent on that iteration/stratum/whole run
+    '''
+    kind: str
+    stratum: int
+    relations: [str]
+    iteration: int
+    delta_size: int
+    elapsed: float
+    output: dict = None
+
+
 class DatalogIntepretor:
     ''' interpretor '''
 
     def __init__(self):
-        self.engine = create_engine('sqlite://', echo=False)
+        # run_async evaluate the program in an executor thread
+        self.engine = create_engine(
+            'sqlite://', echo=False, connect_args={'check_same_thread': False})
         self.db_conn = self.engine.connect()
         self.db_meta = MetaData(bind=self.db_conn)
         self.clauses = []
@@ -50,6 +76,19 @@ class DatalogIntepretor:
 
     def run(self, program: DatalogProgram, silent=False):
         ''' run a datalog program '''
+        for event in self.iter_run(program):
+            if event.kind == STRATUM_EVENT and not silent:
+                print('reach fixpoint!')
+        if not silent:
+            self.print_output()
+        return self.fetch_output()
+
+    def iter_run(self, program: DatalogProgram):
+        '''
+        run a datalog program step by step, yield a EvalProgress after every
+        semi-naive iteration and every stratum, the last event carry the output
+        '''
+        run_start = time.perf_counter()
         for decl in program.rel_decls:
             self.add_declaration(decl)
         self.__create_table()
@@ -59,6 +98,7 @@ class DatalogIntepretor:
             self.add_fact(fact)
         self.output_relnames = program.output
         # TODO: compute scc first
+        stratum = 0
         while True:
             sccs = list(nx.strongly_connected_components(self.rel_graph))
             if sccs == []:
@@ -71,13 +111,58 @@ class DatalogIntepretor:
                 if scc_clauses == []:
                     computed = computed + list(scc)
                     continue
-                self.compute_fixpoint(scc_clauses)
+                relations = sorted(scc)
+                stratum_start = time.perf_counter()
+                iteration = 0
+                for iteration, Δ_count, elapsed in self.__semi_naive(scc_clauses):
+                    yield EvalProgress(ITERATION_EVENT, stratum, relations,
+                                       iteration, Δ_count, elapsed)
+                yield EvalProgress(STRATUM_EVENT, stratum, relations, iteration, 0,
+                                   time.perf_counter() - stratum_start)
+                stratum = stratum + 1
                 computed = computed + list(scc)
             self.rel_graph.remove_nodes_from(computed)
         # self.compute_fixpoint(program.clauses)
-        if not silent:
-            self.print_output()
-        return self.fetch_output()
+        yield EvalProgress(FINISH_EVENT, stratum, list(self.output_relnames), 0, 0,
+                           time.perf_counter() - run_start, self.fetch_output())
+
+    async def run_async(self, program: DatalogProgram, executor=None):
+        '''
+        run a datalog program in executor (default one of current loop if None)
+        without blocking the event loop, async iterate the EvalProgress events
+        of iter_run. Stop iterating (break/aclose/cancel the task) cancel the
+        evaluation at the end of current iteration.
+        '''
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        cancelled = threading.Event()
+        done = object()
+
+        def evaluate():
+            steps = self.iter_run(program)
+            try:
+                for event in steps:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, event)
+            finally:
+                steps.close()
+                loop.call_soon_threadsafe(events.put_nowait, done)
+
+        job = loop.run_in_executor(executor, evaluate)
+        try:
+            while True:
+                event = await events.get()
+                if event is done:
+                    break
+                yield event
+            # raise the error of evaluation if there is one
+            await job
+        finally:
+            cancelled.set()
+            if not job.done():
+                # database can't be touched again before worker stop
+                await asyncio.shield(job)
 
     def add_fact(self, fact: Fact):
         ''' add a fact into EDB '''
@@ -262,6 +347,15 @@ class DatalogIntepretor:
         ''' 
         compute the fixpoint of a set of horn clause using semi-naive evaluation
         '''
+        for _ in self.__semi_naive(clauses):
+            pass
+        print('reach fixpoint!')
+
+    def __semi_naive(self, clauses: [HornClause]):
+        '''
+        semi-naive evaluation of a set of horn clause, yield
+        (iteration, Δ size, elapsed seconds) after every iteration
+        '''
         # all relation name needed to be computed
         rel_names = set()
         rel_in_clauases = []
@@ -275,6 +369,8 @@ class DatalogIntepretor:
         # only need to keep track of the number of record inside db
         # the result of sqlalchemy will not contain any info when executing multi instert so put this silly code here
         prev_count = 0
+        iteration = 0
+        iter_start = time.perf_counter()
         while True:
             Δ_count = 0
             for name in rel_names:
@@ -282,10 +378,13 @@ class DatalogIntepretor:
                 stmt = select(func.count()).select_from(table)
                 res = self.db_conn.execute(stmt)
                 Δ_count = Δ_count + res.fetchone()[0]
+            if iteration > 0:
+                yield iteration, Δ_count, time.perf_counter() - iter_start
             if Δ_count == prev_count:
-                print('reach fixpoint!')
                 break
             prev_count = Δ_count
+            iteration = iteration + 1
+            iter_start = time.perf_counter()
             for clause in clauses:
                 target_table = self.__get_table(clause.head.name)
                 target_Δ_table = self.__get_Δ_table(clause.head.name)